@@ -1,16 +1,84 @@
 import os
 import re
+import sys
+import pickle
+import hashlib
 import requests
-import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import fnmatch
-from github import Github
+from concurrent.futures import ThreadPoolExecutor
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 REPO = os.getenv("GITHUB_REPOSITORY")
 PR_NUMBER = os.getenv("GITHUB_EVENT_PULL_REQUEST_NUMBER")
 CODEOWNERS_PATH = "CODEOWNERS"  # Path to the CODEOWNERS file (default: repository root)
+# Parsed CODEOWNERS tries keyed by ETag, persisted across runs via actions/cache
+CODEOWNERS_CACHE_DIR = os.path.expanduser("~/.cache/globis-stage")
 FILTER_YML_PATH = ".github/filters.yml"  # Path to the filters YAML file
 DEFAULT_LABEL_COLOR = "CCCCCC"
+OWNERS_KEY = "__owners__"  # Trie node key holding the CODEOWNERS assignees
+LABEL_KEY = "__label__"  # Trie node key holding the CODEOWNERS path (label)
+GLOB_CHARS_RE = re.compile(r"[*?[]")  # fnmatch wildcard characters
+_CODEOWNERS_RE = re.compile(r"(?<!\S)@[\w-]+")  # @user owners in a CODEOWNERS line
+GITHUB_API_URL = "https://api.github.com"
+GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+
+# Shared session so every GitHub request reuses the same TCP+TLS connection
+SESSION = requests.Session()
+SESSION.headers.update({"Authorization": f"bearer {GITHUB_TOKEN}"})
+# Retry transient gateway errors; GraphQL queries are POSTs but safe to repeat
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "POST"],
+        ),
+    ),
+)
+
+CHANGED_FILES_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $cursor: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      files(first: 100, after: $cursor) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        nodes {
+          path
+        }
+      }
+    }
+  }
+}
+"""
+
+LABELS_QUERY = """
+query($owner: String!, $repo: String!, $cursor: String) {
+  repository(owner: $owner, name: $repo) {
+    labels(first: 100, after: $cursor) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        color
+      }
+    }
+  }
+}
+"""
+
+# Repository labels (name -> color), fetched once per run by get_all_labels
+_labels_cache = None
 
 
 class GitHubLabelError(Exception):
@@ -33,33 +101,102 @@ def validate_environment():
         )
 
 
-def get_changed_files(github_client, repo_name, pr_number):
-    """Fetch the changed files in the pull request using PyGithub."""
+def run_graphql_query(query, variables, headers=None):
+    """Run a query against the GitHub GraphQL API and return its data."""
+    response = SESSION.post(
+        GRAPHQL_URL, json={"query": query, "variables": variables}, headers=headers
+    )
+    response.raise_for_status()
+    result = response.json()
+    if result.get("errors"):
+        raise GitHubLabelError(f"GraphQL query failed: {result['errors']}")
+    return result["data"]
+
+
+def fetch_changed_files_graphql(token, owner, repo, pr_number):
+    """
+    Fetch the changed files in the pull request using the GraphQL API.
+    Files are paginated 100 at a time instead of REST's 30 per page.
+    """
+    # Runs on a worker thread, so the token goes on each request rather than
+    # on the shared session
+    headers = {"Authorization": f"bearer {token}"} if token else None
+
+    changed_files = []
+    cursor = None
     try:
-        repo = github_client.get_repo(repo_name)
-        pull_request = repo.get_pull(pr_number)
-        return [file.filename for file in pull_request.get_files()]
+        while True:
+            data = run_graphql_query(
+                CHANGED_FILES_QUERY,
+                {"owner": owner, "repo": repo, "number": pr_number, "cursor": cursor},
+                headers=headers,
+            )
+            files = data["repository"]["pullRequest"]["files"]
+            changed_files.extend(node["path"] for node in files["nodes"])
+            if not files["pageInfo"]["hasNextPage"]:
+                return changed_files
+            cursor = files["pageInfo"]["endCursor"]
     except Exception as e:
         raise GitHubLabelError(f"Failed to fetch changed files: {str(e)}")
 
 
 def read_codeowners(repo, branch=None):
     """
-    Read the CODEOWNERS file and extract valid label paths and user assignments.
+    Read the CODEOWNERS file into a trie keyed by path segment.
     If a branch is provided, the file is fetched from that branch.
+    The parsed trie is cached on disk with the response ETag; while the file
+    is unchanged GitHub answers the conditional request with an empty 304.
     """
+    cache_key = f"{repo.full_name}:{branch}:{CODEOWNERS_PATH}"
+    cache_path = os.path.join(
+        CODEOWNERS_CACHE_DIR, hashlib.sha1(cache_key.encode()).hexdigest() + ".pickle"
+    )
+    cached_etag, cached_trie = None, None
     try:
-        if branch:
-            contents = repo.get_contents(CODEOWNERS_PATH, ref=branch)
-        else:
-            contents = repo.get_contents(CODEOWNERS_PATH)
-        codeowners_data = contents.decoded_content.decode("utf-8")
+        with open(cache_path, "rb") as cache:
+            cached_etag, cached_trie = pickle.load(cache)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+
+    headers = {"Accept": "application/vnd.github.raw"}
+    if cached_etag:
+        headers["If-None-Match"] = cached_etag
+    try:
+        response = SESSION.get(
+            f"{GITHUB_API_URL}/repos/{repo.full_name}/contents/{CODEOWNERS_PATH}",
+            headers=headers,
+            params={"ref": branch} if branch else None,
+        )
+        if response.status_code == 304:
+            print("CODEOWNERS file unchanged, using cached CODEOWNERS paths")
+            return cached_trie
+        response.raise_for_status()
+        codeowners_data = response.content.decode("utf-8")
     except Exception as e:
         print(f"Warning: Failed to read CODEOWNERS file: {e}")
-        return set(), {}
+        return {}
+
+    trie = parse_codeowners(codeowners_data)
+
+    etag = response.headers.get("ETag")
+    if etag:
+        try:
+            os.makedirs(CODEOWNERS_CACHE_DIR, exist_ok=True)
+            with open(cache_path, "wb") as cache:
+                pickle.dump((etag, trie), cache, pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Warning: Failed to write CODEOWNERS cache: {e}")
+    return trie
+
 
+def parse_codeowners(codeowners_data):
+    """
+    Parse CODEOWNERS content into a trie keyed by path segment.
+    Nodes for a CODEOWNERS path store its assignees and label, so a lookup
+    only has to walk down the trie once per file.
+    """
+    trie = {}
     valid_labels = set()
-    assignees_map = {}
 
     for line in codeowners_data.splitlines():
         line = line.strip()
@@ -67,116 +204,232 @@ def read_codeowners(repo, branch=None):
             continue
 
         # Extract the path and the list of assignees (usernames starting with @)
-        match = re.match(r"(\S+)\s+(@[\w-]+(?:\s+@[\w-]+)*)", line)
-        if match:
-            path = match.group(1).rstrip("/")
+        parts = line.split(None, 1)
+        if len(parts) < 2:
+            continue
+        # Owners end where a trailing "# comment" starts
+        assignees = _CODEOWNERS_RE.findall(parts[1].split("#", 1)[0])
+        if assignees:
+            path = parts[0].rstrip("/")
             if path.startswith("/"):
                 path = path[1:]
             valid_labels.add(path)
-            assignees = match.group(2).split()
-            assignees_map[path] = assignees
+            node = trie
+            for part in path.split("/"):
+                node = node.setdefault(part, {})
+            node[OWNERS_KEY] = assignees
+            node[LABEL_KEY] = path
 
     print(f"Extracted CODEOWNERS paths: {valid_labels}")
-    return valid_labels, assignees_map
+    return trie
+
+
+def walk(trie, parts):
+    """
+    Walk the CODEOWNERS trie along the given path segments.
+    Returns the node reached for the full path (None if the trie ends early)
+    and the deepest node along the way that has assignees (or None).
+    """
+    node, best = trie, None
+    for part in parts:
+        node = node.get(part)
+        if node is None:
+            break
+        if OWNERS_KEY in node:
+            best = node
+    return node, best
+
+
+def lookup_file(trie, file_path, dir_cache):
+    """
+    Return the deepest CODEOWNERS node with assignees for a file, or None.
+    The directory walk is cached in dir_cache so files sharing a directory
+    only walk the trie once; only a CODEOWNERS entry for the file itself can
+    override its directory's result.
+    """
+    directory, _, name = file_path.rpartition("/")
+    if directory not in dir_cache:
+        dir_cache[directory] = walk(trie, directory.split("/") if directory else [])
+    dir_node, best = dir_cache[directory]
+
+    if dir_node is not None:
+        file_node = dir_node.get(name)
+        if file_node is not None and OWNERS_KEY in file_node:
+            return file_node
+    return best
+
+
+def iter_owner_nodes(trie):
+    """Yield every trie node that carries CODEOWNERS assignees."""
+    stack = [trie]
+    while stack:
+        node = stack.pop()
+        if OWNERS_KEY in node:
+            yield node
+        stack.extend(
+            child for key, child in node.items() if key not in (OWNERS_KEY, LABEL_KEY)
+        )
 
 
 def read_filter_yml():
     """Read the filter.yml file and parse it into a dictionary."""
     try:
+        # PyYAML is only needed here, so import it on first use; prefer the
+        # libyaml-backed loader when available
+        import yaml
+
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
         with open(FILTER_YML_PATH, "r") as file:
-            filter_data = yaml.safe_load(file)
+            filter_data = yaml.load(file, Loader=loader)
         return filter_data
     except Exception as e:
         print(f"Warning: Failed to read filter.yml file: {e}")
         return {}
 
 
-def get_label_for_file(file, filter_data):
-    """Get label for the file based on filter.yml mapping."""
-    for label, patterns in filter_data.items():
-        if isinstance(patterns, list):
-            for pattern in patterns:
-                if fnmatch.fnmatch(file, pattern):
-                    return label
-        elif fnmatch.fnmatch(file, patterns):
-            return label
-    return None
+def compile_filter_patterns(filter_data):
+    """
+    Compile all filter.yml glob patterns for fast matching.
+    Patterns without wildcards are matched by exact lookup, patterns whose
+    only wildcard is a trailing '*' by startswith, and everything else through
+    a single alternation regex with one named group per label.
+    Returns (literals, prefixes, pattern, labels); labels are kept by index so
+    the first label in file order still wins, as with the sequential scan.
+    """
+    labels = list(filter_data)
+    literals = {}
+    prefixes = []
+    groups = []
+    for index, patterns in enumerate(filter_data.values()):
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        alternatives = []
+        for pattern in patterns:
+            if not GLOB_CHARS_RE.search(pattern):
+                literals.setdefault(pattern, index)
+            elif pattern.endswith("*") and not GLOB_CHARS_RE.search(pattern[:-1]):
+                prefixes.append((pattern[:-1], index))
+            else:
+                alternatives.append(fnmatch.translate(pattern))
+        if alternatives:
+            groups.append(f"(?P<L{index}>{'|'.join(alternatives)})")
+
+    pattern = re.compile("|".join(groups)) if groups else None
+    return literals, prefixes, pattern, labels
+
+
+def get_label_for_file(file, compiled_filters):
+    """Get label for the file based on the compiled filter.yml mapping."""
+    literals, prefixes, pattern, labels = compiled_filters
+
+    # Cheapest checks first; prefixes are in label order, so stop at the first
+    # hit or once no prefix can beat the current best label.
+    best = literals.get(file)
+    for prefix, index in prefixes:
+        if best is not None and index >= best:
+            break
+        if file.startswith(prefix):
+            best = index
+            break
+
+    if pattern is not None and best != 0:
+        match = pattern.match(file)
+        if match:
+            index = int(match.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+
+    return labels[best] if best is not None else None
 
 
-def process_files(changed_files, valid_labels, filter_data):
+def process_files(changed_files, codeowners_trie, compiled_filters):
     """
     Generate labels based on changed files.
     Priority is given to any label found in filters.yml. If none is found,
     then the CODEOWNERS file is used to match a directory or file path.
     """
-    labels = set()
-
+    # First check the filters.yml mappings (highest priority). Patterns can
+    # match file names, so every file is checked.
     for file in changed_files:
-        print(f"\nProcessing file: {file}")
-
-        # First check the filters.yml mappings (highest priority)
-        special_label = get_label_for_file(file, filter_data)
+        special_label = get_label_for_file(file, compiled_filters)
         if special_label:
-            labels = {special_label}
             print(f"Matched {file} to filters.yml label: {special_label}")
-            return labels
-
-        # Otherwise, check the CODEOWNERS mapping.
-        parts = file.split("/")
-        for i in range(len(parts), 0, -1):
-            possible_label = "/".join(parts[:i])
-            if possible_label in valid_labels:
-                labels.add(possible_label)
-                print(f"Matched {file} to CODEOWNERS label: {possible_label}")
-                break
+            return {special_label}
+
+    # Otherwise, check the CODEOWNERS mapping. Files in the same directory
+    # share one trie walk.
+    labels = set()
+    dir_cache = {}
+    for file in changed_files:
+        best = lookup_file(codeowners_trie, file, dir_cache)
+        if best is not None and best[LABEL_KEY] not in labels:
+            labels.add(best[LABEL_KEY])
+            print(f"Matched {file} to CODEOWNERS label: {best[LABEL_KEY]}")
 
     return labels
 
 
-def create_labels(repo, labels):
-    """Create labels in the repository if they don't already exist."""
-    existing_labels = {label.name: label for label in repo.get_labels()}
-
-    for label in labels:
-        if label not in existing_labels:
-            try:
-                repo.create_label(
-                    name=label,
-                    color=DEFAULT_LABEL_COLOR,
-                    description="Auto-generated from directory structure",
-                )
-                print(f"Created label: {label}")
-            except Exception as e:
-                print(f"Warning: Failed to create label '{label}': {e}")
-
-
-def get_assignees_for_path(file_path, assignees_map):
+def get_all_labels(repo):
     """
-    Determine the set of assignees for a given file path based on the CODEOWNERS mapping.
-    Checks for an exact match, then progressively less specific directory matches,
-    and finally a wildcard '*' entry.
+    Return all repository labels as a name -> color dict.
+    Labels are fetched once via GraphQL (100 per page) and cached for the run.
     """
-    # Check for an exact match.
-    if file_path in assignees_map:
-        return set(assignee.lstrip("@") for assignee in assignees_map[file_path])
-
-    # Check directory matches from most to least specific.
-    parts = file_path.split("/")
-    for i in range(len(parts), 0, -1):
-        possible_path = "/".join(parts[:i])
-        if possible_path in assignees_map:
-            return set(
-                assignee.lstrip("@") for assignee in assignees_map[possible_path]
+    global _labels_cache
+    if _labels_cache is None:
+        owner, repo_name = repo.full_name.split("/", 1)
+        labels = {}
+        cursor = None
+        while True:
+            data = run_graphql_query(
+                LABELS_QUERY, {"owner": owner, "repo": repo_name, "cursor": cursor}
             )
+            page = data["repository"]["labels"]
+            labels.update((node["name"], node["color"]) for node in page["nodes"])
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            cursor = page["pageInfo"]["endCursor"]
+        _labels_cache = labels
+    return _labels_cache
 
-    # Check for a wildcard '*' mapping.
-    if "*" in assignees_map:
-        return set(assignee.lstrip("@") for assignee in assignees_map["*"])
 
-    return set()
+def create_labels(repo, labels):
+    """Create labels in the repository if they don't already exist."""
+    existing_labels = get_all_labels(repo)
+
+    for label in set(labels) - existing_labels.keys():
+        try:
+            repo.create_label(
+                name=label,
+                color=DEFAULT_LABEL_COLOR,
+                description="Auto-generated from directory structure",
+            )
+            existing_labels[label] = DEFAULT_LABEL_COLOR
+            print(f"Created label: {label}")
+        except Exception as e:
+            print(f"Warning: Failed to create label '{label}': {e}")
 
 
-def find_common_assignees(changed_files, assignees_map):
+def get_assignees_for_path(file_path, codeowners_trie, dir_cache=None, wildcard=None):
+    """
+    Determine the set of assignees for a given file path based on the CODEOWNERS trie.
+    Uses the most specific matching path, and finally a wildcard '*' entry.
+    Pass a shared dir_cache (and the precomputed wildcard node) when resolving
+    many files so each directory is only walked once.
+    """
+    if dir_cache is None:
+        dir_cache = {}
+    best = lookup_file(codeowners_trie, file_path, dir_cache)
+
+    # Fall back to the wildcard '*' mapping.
+    if best is None:
+        best = wildcard if wildcard is not None else codeowners_trie.get("*")
+    if best is None or OWNERS_KEY not in best:
+        return set()
+
+    return set(assignee.lstrip("@") for assignee in best[OWNERS_KEY])
+
+
+def find_common_assignees(changed_files, codeowners_trie):
     """
     Find the set of common assignees responsible for all changed files.
     If no common assignees exist, fall back to returning all unique assignees.
@@ -184,21 +437,29 @@ def find_common_assignees(changed_files, assignees_map):
     if not changed_files:
         return set()
 
+    # Files in the same directory share one trie walk.
+    dir_cache = {}
+    wildcard = codeowners_trie.get("*", {})
+
     # Start with the assignees for the first file.
-    common_assignees = get_assignees_for_path(changed_files[0], assignees_map)
+    common_assignees = get_assignees_for_path(
+        changed_files[0], codeowners_trie, dir_cache, wildcard
+    )
 
     # Intersect with assignees from each subsequent file.
     for file in changed_files[1:]:
-        file_assignees = get_assignees_for_path(file, assignees_map)
-        common_assignees.intersection_update(file_assignees)
         if not common_assignees:
             break
+        file_assignees = get_assignees_for_path(
+            file, codeowners_trie, dir_cache, wildcard
+        )
+        common_assignees.intersection_update(file_assignees)
 
     # Fallback: if no common assignees, return all unique assignees.
     if not common_assignees:
         all_assignees = set()
-        for assignees in assignees_map.values():
-            all_assignees.update(assignee.lstrip("@") for assignee in assignees)
+        for node in iter_owner_nodes(codeowners_trie):
+            all_assignees.update(assignee.lstrip("@") for assignee in node[OWNERS_KEY])
         if all_assignees:
             print("No common assignees found. Assigning all possible assignees.")
             return all_assignees
@@ -238,25 +499,40 @@ def assign_assignees(repo, pr_number, assignees):
 def main():
     try:
         validate_environment()
+        # PyGithub is heavy to import, so only load it once the run is valid
+        from github import Github
+
         github_client = Github(GITHUB_TOKEN)
-        repo = github_client.get_repo(REPO)
         pr_number_int = int(PR_NUMBER)
+        owner, repo_name = REPO.split("/", 1)
+
+        # The setup requests are independent, so run them concurrently
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # Get changed files from the pull request and read filters
+            files_future = executor.submit(
+                fetch_changed_files_graphql,
+                GITHUB_TOKEN,
+                owner,
+                repo_name,
+                pr_number_int,
+            )
+            filters_future = executor.submit(read_filter_yml)
 
-        # Retrieve the pull request and use its head branch for the CODEOWNERS file
-        pull_request = repo.get_pull(pr_number_int)
-        branch = pull_request.head.ref
-        print(f"Using CODEOWNERS file from branch: {branch}")
+            # Retrieve the pull request and use its head branch for the CODEOWNERS file
+            repo = github_client.get_repo(REPO)
+            pull_request = repo.get_pull(pr_number_int)
+            branch = pull_request.head.ref
+            print(f"Using CODEOWNERS file from branch: {branch}")
+            codeowners_future = executor.submit(read_codeowners, repo, branch)
 
-        # Read CODEOWNERS and filters
-        valid_labels, assignees_map = read_codeowners(repo, branch=branch)
-        filter_data = read_filter_yml()
+            changed_files = files_future.result()
+            compiled_filters = compile_filter_patterns(filters_future.result())
+            codeowners_trie = codeowners_future.result()
 
-        # Get changed files from the pull request
-        changed_files = [file.filename for file in pull_request.get_files()]
         print(f"Changed files in PR: {changed_files}")
 
         # Process files to determine which labels to apply
-        labels = process_files(changed_files, valid_labels, filter_data)
+        labels = process_files(changed_files, codeowners_trie, compiled_filters)
         if labels:
             print(f"Found labels: {', '.join(labels)}")
             create_labels(repo, labels)
@@ -265,7 +541,7 @@ def main():
             print("No matching labels found")
 
         # Determine and assign common assignees (or all if none are common)
-        common_assignees = find_common_assignees(changed_files, assignees_map)
+        common_assignees = find_common_assignees(changed_files, codeowners_trie)
         if common_assignees:
             print(f"Found common assignees: {common_assignees}")
             assign_assignees(repo, pr_number_int, common_assignees)
@@ -278,4 +554,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
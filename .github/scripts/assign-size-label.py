@@ -1,10 +1,12 @@
 import os
-from github import Github
+import sys
+import bisect
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Get environment variables
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-REPO_NAME = os.getenv("GITHUB_REPOSITORY")
-PR_NUMBER = int(os.getenv("GITHUB_PR_NUMBER"))
+GRAPHQL_URL = "https://api.github.com/graphql"
 
 # Define size labels, their ranges, and colors
 size_labels = {
@@ -16,71 +18,159 @@ size_labels = {
     "XXL": ((1000, float("inf")), "B71C1C"),
 }
 
-# Initialize GitHub client
-gh = Github(GITHUB_TOKEN)
-repo = gh.get_repo(REPO_NAME)
-pr = repo.get_pull(PR_NUMBER)
+# Upper bounds of every size range but the last, for bisecting changed lines
+SIZE_NAMES = list(size_labels)
+SIZE_THRESHOLDS = [max_lines for (_, max_lines), _ in list(size_labels.values())[:-1]]
 
-
-def get_changed_lines():
-    files = pr.get_files()
-    changed_lines = sum(f.additions + f.deletions for f in files)
+CHANGED_LINES_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      additions
+      deletions
+    }
+  }
+}
+"""
+
+LABELS_QUERY = """
+query($owner: String!, $repo: String!, $cursor: String) {
+  repository(owner: $owner, name: $repo) {
+    labels(first: 100, after: $cursor) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        color
+      }
+    }
+  }
+}
+"""
+
+# Repository labels (name -> color), fetched once per run by get_all_labels
+_labels_cache = None
+
+# Shared session so every GitHub request reuses the same TCP+TLS connection
+SESSION = requests.Session()
+SESSION.headers.update({"Authorization": f"bearer {GITHUB_TOKEN}"})
+# Retry transient gateway errors; GraphQL queries are POSTs but safe to repeat
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "POST"],
+        ),
+    ),
+)
+
+
+def run_graphql_query(query, variables):
+    """Run a query against the GitHub GraphQL API and return its data."""
+    response = SESSION.post(GRAPHQL_URL, json={"query": query, "variables": variables})
+    response.raise_for_status()
+    result = response.json()
+    if result.get("errors"):
+        raise RuntimeError(f"GraphQL query failed: {result['errors']}")
+    return result["data"]
+
+
+def get_all_labels(full_repo_name):
+    """
+    Return all repository labels as a name -> color dict.
+    Labels are fetched once via GraphQL (100 per page) and cached for the run.
+    """
+    global _labels_cache
+    if _labels_cache is None:
+        owner, repo_name = full_repo_name.split("/", 1)
+        labels = {}
+        cursor = None
+        while True:
+            data = run_graphql_query(
+                LABELS_QUERY, {"owner": owner, "repo": repo_name, "cursor": cursor}
+            )
+            page = data["repository"]["labels"]
+            labels.update((node["name"], node["color"]) for node in page["nodes"])
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            cursor = page["pageInfo"]["endCursor"]
+        _labels_cache = labels
+    return _labels_cache
+
+
+def get_changed_lines(full_repo_name, pr_number):
+    # PR-level totals, so no per-file pages or patch bodies are downloaded
+    owner, repo_name = full_repo_name.split("/", 1)
+    data = run_graphql_query(
+        CHANGED_LINES_QUERY, {"owner": owner, "repo": repo_name, "number": pr_number}
+    )
+    totals = data["repository"]["pullRequest"]
+    changed_lines = totals["additions"] + totals["deletions"]
     print(f"Total changed lines: {changed_lines}")
     return changed_lines
 
 
 def determine_size_label(changed_lines):
-    for label, (range_values, _) in size_labels.items():
-        min_lines, max_lines = range_values
-        if min_lines <= changed_lines <= max_lines:
-            return label
-    return None
-
-
-def remove_existing_size_labels(correct_label):
-    labels_to_remove = [
-        label.name
-        for label in pr.get_labels()
-        if label.name in size_labels and label.name != correct_label
-    ]
-    for label in labels_to_remove:
-        pr.remove_from_labels(label)
-        print(f"Removed label: {label}")
+    # Range upper bounds are inclusive, hence bisect_left
+    return SIZE_NAMES[bisect.bisect_left(SIZE_THRESHOLDS, changed_lines)]
 
 
-def assign_label(label):
+def ensure_size_label(repo, label):
     color = size_labels[label][1]
-    existing_labels = {
-        label_obj.name: label_obj.color for label_obj in repo.get_labels()
-    }
-    current_labels = [label_obj.name for label_obj in pr.get_labels()]
-
-    # Check if the correct label is already assigned
-    if label in current_labels:
-        print(f"Label '{label}' is already assigned. Skipping.")
-        return
+    existing_labels = get_all_labels(repo.full_name)
 
     # Check if the label exists with the correct color
     if label not in existing_labels:
         # Create the label if it doesn't exist
         repo.create_label(name=label, color=color)
+        existing_labels[label] = color
         print(f"Created label: {label} with color: {color}")
-    elif existing_labels[label] != color:
+    elif existing_labels[label].upper() != color:
         # Update the color if it exists but with a different color
         repo.get_label(label).edit(name=label, color=color)
+        existing_labels[label] = color
         print(f"Updated label color: {label} to {color}")
 
-    # Add label to the PR
-    pr.add_to_labels(label)
-    print(f"Assigned label: {label}")
 
+def main():
+    # Get environment variables
+    repo_name = os.getenv("GITHUB_REPOSITORY")
+    pr_number = int(os.getenv("GITHUB_PR_NUMBER"))
 
-if __name__ == "__main__":
-    changed_lines = get_changed_lines()
+    changed_lines = get_changed_lines(repo_name, pr_number)
     size_label = determine_size_label(changed_lines)
 
-    if size_label:
-        remove_existing_size_labels(size_label)
-        assign_label(size_label)
-    else:
-        print("No size label determined.")
+    # PyGithub is heavy to import, so only load it once the size is known
+    from github import Github
+
+    # Initialize GitHub client
+    gh = Github(GITHUB_TOKEN)
+    repo = gh.get_repo(repo_name)
+    pr = repo.get_pull(pr_number)
+
+    # Labels come with the pull request payload, so no extra request is needed
+    current_labels = {label.name for label in pr.labels}
+
+    # Only the label being assigned needs to exist in the repository
+    if size_label not in current_labels:
+        ensure_size_label(repo, size_label)
+
+    # Replace stale size labels with the correct one in a single request
+    labels_to_remove = (current_labels & size_labels.keys()) - {size_label}
+    final_labels = (current_labels - size_labels.keys()) | {size_label}
+    if final_labels == current_labels:
+        print(f"Label '{size_label}' is already assigned. Skipping.")
+        return
+    pr.set_labels(*final_labels)
+    for label in labels_to_remove:
+        print(f"Removed label: {label}")
+    print(f"Assigned label: {size_label}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
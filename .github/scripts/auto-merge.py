@@ -1,19 +1,57 @@
 # Import necessary libraries
 import os  # For accessing environment variables
+import sys  # For the process exit code
 import requests  # For making HTTP requests to GitHub API
-
-
-def get_github_api_headers():
-    """
-    Create and return headers required for GitHub API authentication.
-
-    Returns:
-        dict: Headers including the authentication token and API version specification
-    """
-    return {
+from requests.adapters import HTTPAdapter  # For connection pooling and retries
+from urllib3.util.retry import Retry  # For retrying transient GitHub errors
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Labels and review state needed to decide on auto-merging, in one round trip
+MERGE_STATE_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      reviewDecision
+      labels(first: 100) {
+        nodes {
+          name
+        }
+      }
+      latestReviews(first: 100) {
+        nodes {
+          state
+        }
+      }
+    }
+  }
+}
+"""
+
+# Shared session so all GitHub API calls reuse one keep-alive connection
+SESSION = requests.Session()
+SESSION.headers.update(
+    {
         "Authorization": f"Bearer {os.getenv('GH_TOKEN')}",  # Use GitHub token from environment variable
         "Accept": "application/vnd.github.v3+json",  # Specify GitHub API version
     }
+)
+# Retry transient gateway errors instead of failing the whole run
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            # GraphQL queries are POSTs; the merge PUT is not retried, since a
+            # 5xx may come after GitHub already merged
+            allowed_methods=["GET", "POST"],
+        ),
+    ),
+)
 
 
 def get_pr_details(repo, pr_number):
@@ -31,51 +69,54 @@ def get_pr_details(repo, pr_number):
         HTTPError: If the API request fails
     """
     url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}"
-    response = requests.get(url, headers=get_github_api_headers())
+    response = SESSION.get(url)
     response.raise_for_status()  # Raise exception for 4XX/5XX responses
     return response.json()
 
 
-def get_pr_labels(repo, pr_number):
+def get_pr_merge_state(repo, pr_number):
     """
-    Fetch labels attached to a specific pull request.
+    Fetch the labels and review state of a pull request in one GraphQL query.
 
     Args:
         repo (str): Repository name in format 'owner/repo'
         pr_number (str): Pull request number
 
     Returns:
-        list: List of label names
+        tuple: List of label names and whether the PR is approved
 
     Raises:
         HTTPError: If the API request fails
+        RuntimeError: If the GraphQL query returns errors
     """
-    # Note: GitHub's API uses the issues endpoint for PR labels
-    url = f"https://api.github.com/repos/{repo}/issues/{pr_number}/labels"
-    response = requests.get(url, headers=get_github_api_headers())
+    owner, name = repo.split("/", 1)
+    response = SESSION.post(
+        GRAPHQL_URL,
+        json={
+            "query": MERGE_STATE_QUERY,
+            "variables": {"owner": owner, "repo": name, "number": int(pr_number)},
+        },
+    )
     response.raise_for_status()
-    return [label["name"] for label in response.json()]  # Extract just the label names
+    result = response.json()
+    if result.get("errors"):
+        raise RuntimeError(f"GraphQL query failed: {result['errors']}")
 
+    pull_request = result["data"]["repository"]["pullRequest"]
+    labels = [label["name"] for label in pull_request["labels"]["nodes"]]
 
-def is_pr_approved(repo, pr_number):
-    """
-    Check if a pull request has been approved by reviewers.
+    # reviewDecision accounts for dismissed and stale reviews; it is only null
+    # when the branch doesn't require reviews, so fall back to the latest reviews
+    review_decision = pull_request["reviewDecision"]
+    if review_decision is None:
+        approved = any(
+            review["state"] == "APPROVED"
+            for review in pull_request["latestReviews"]["nodes"]
+        )
+    else:
+        approved = review_decision == "APPROVED"
 
-    Args:
-        repo (str): Repository name in format 'owner/repo'
-        pr_number (str): Pull request number
-
-    Returns:
-        bool: True if PR has at least one approval, False otherwise
-
-    Raises:
-        HTTPError: If the API request fails
-    """
-    url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}/reviews"
-    response = requests.get(url, headers=get_github_api_headers())
-    response.raise_for_status()
-    # Return True if any review has an 'APPROVED' state
-    return any(review["state"] == "APPROVED" for review in response.json())
+    return labels, approved
 
 
 def enable_auto_merge(repo, pr_number):
@@ -90,9 +131,7 @@ def enable_auto_merge(repo, pr_number):
         HTTPError: If the API request fails or the merge cannot be completed
     """
     url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}/merge"
-    response = requests.put(
-        url, headers=get_github_api_headers(), json={"merge_method": "merge"}
-    )
+    response = SESSION.put(url, json={"merge_method": "merge"})
     response.raise_for_status()
     print("Auto-merged PR successfully.")
 
@@ -116,13 +155,16 @@ def main():
         print("Missing repository or PR number.")
         return
 
+    # Fetch labels and approval state together
+    labels, approved = get_pr_merge_state(repo, pr_number)
+
     # Check for label that would prevent auto-merge
-    if "no-auto-merge" in get_pr_labels(repo, pr_number):
+    if "no-auto-merge" in labels:
         print("PR has 'no-auto-merge' label, skipping auto-merge.")
         return
 
     # Check if PR is approved
-    if not is_pr_approved(repo, pr_number):
+    if not approved:
         print("PR is not approved, skipping auto-merge.")
         return
 
@@ -131,4 +173,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,87 +1,131 @@
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Environment variables from GitHub Action
-pr_number = os.getenv("PR_NUMBER")
-pr_user = os.getenv("PR_USER")
-slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
-github_token = os.getenv("GITHUB_TOKEN")
-repository = os.getenv("REPOSITORY")
+# GitHub GraphQL API URL
+graphql_api_url = "https://api.github.com/graphql"
 
-# Handle missing repository variable
-if not repository:
-    # Fallback - try to get from GitHub environment file
-    try:
-        with open(os.getenv("GITHUB_ENV", ""), "r") as f:
-            for line in f:
-                if line.startswith("GITHUB_REPOSITORY="):
-                    repository = line.strip().split("=", 1)[1]
-                    break
-    except FileNotFoundError:
-        print("GitHub environment file not found.")
+# Slack mapping file
+mapping_file = ".github/slack-mapping.json"
+
+# PR details, labels and author avatar in a single round trip
+pr_query = """
+query($owner: String!, $repo: String!, $number: Int!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      title
+      url
+      labels(first: 100) {
+        nodes {
+          name
+        }
+      }
+      author {
+        login
+        avatarUrl
+      }
+    }
+  }
+}
+"""
+
+
+def main():
+    # Environment variables from GitHub Action
+    pr_number = os.getenv("PR_NUMBER")
+    pr_user = os.getenv("PR_USER")
+    slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+    github_token = os.getenv("GITHUB_TOKEN")
+    repository = os.getenv("REPOSITORY")
+
+    # Handle missing repository variable
+    if not repository:
+        # Fallback - try to get from GitHub environment file
+        try:
+            with open(os.getenv("GITHUB_ENV", ""), "r") as f:
+                for line in f:
+                    if line.startswith("GITHUB_REPOSITORY="):
+                        repository = line.strip().split("=", 1)[1]
+                        break
+        except FileNotFoundError:
+            print("GitHub environment file not found.")
+            exit(1)
+        except Exception as e:
+            print(f"An error occurred while reading the environment file: {e}")
+            exit(1)
+
+        # If still not found, exit with error
+        if not repository:
+            print("Error: Repository name not available in environment variables.")
+            exit(1)
+
+    # Debugging info
+    print(f"Fetching PR details for: {repository}#{pr_number}")
+
+    # Reuse one authenticated keep-alive session for GitHub API calls
+    session = requests.Session()
+    session.headers.update({"Authorization": f"bearer {github_token}"})
+    # Retry transient gateway errors; the GraphQL query is safe to repeat
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=["POST"],
+            ),
+        ),
+    )
+
+    owner, repo_name = repository.split("/", 1)
+    pr_response = session.post(
+        graphql_api_url,
+        json={
+            "query": pr_query,
+            "variables": {"owner": owner, "repo": repo_name, "number": int(pr_number)},
+        },
+    )
+    if pr_response.status_code != 200:
+        print(f"Failed to fetch PR details. Status Code: {pr_response.status_code}")
+        print(f"Response: {pr_response.text}")
         exit(1)
-    except Exception as e:
-        print(f"An error occurred while reading the environment file: {e}")
+
+    pr_result = pr_response.json()
+    if pr_result.get("errors"):
+        print(f"Failed to fetch PR details: {pr_result['errors']}")
         exit(1)
 
-    # If still not found, exit with error
-    if not repository:
-        print("Error: Repository name not available in environment variables.")
+    pr_data = pr_result["data"]["repository"]["pullRequest"]
+    labels = [label["name"] for label in pr_data["labels"]["nodes"]]
+
+    # Check if 'database' label is present
+    if "database" not in labels:
+        print("No 'database' label found. No notification sent.")
+        return
+
+    # Load Slack mapping from file, only needed once a notification is due
+    try:
+        with open(mapping_file, "r") as file:
+            slack_mapping = json.load(file)
+    except FileNotFoundError:
+        print("Slack mapping file not found.")
+        exit(1)
+    except json.JSONDecodeError:
+        print("Invalid JSON format in slack-mapping.json.")
         exit(1)
 
-# Load Slack mapping from file
-mapping_file = ".github/slack-mapping.json"
-try:
-    with open(mapping_file, "r") as file:
-        slack_mapping = json.load(file)
-except FileNotFoundError:
-    print("Slack mapping file not found.")
-    exit(1)
-except json.JSONDecodeError:
-    print("Invalid JSON format in slack-mapping.json.")
-    exit(1)
-
-# GitHub API URLs
-pr_api_url = f"https://api.github.com/repos/{repository}/pulls/{pr_number}"
-user_api_url = f"https://api.github.com/users/{pr_user}"
-
-# Debugging URL
-print(f"Fetching PR details from: {pr_api_url}")
-
-# Get PR details with authentication
-headers = {
-    "Authorization": f"token {github_token}",
-    "Accept": "application/vnd.github.v3+json",
-}
+    pr_title = pr_data.get("title") or "Pull Request"
+    pr_url = pr_data.get("url") or f"https://github.com/{repository}/pull/{pr_number}"
+    profile_picture = (pr_data.get("author") or {}).get(
+        "avatarUrl",
+        "https://github.githubassets.com/images/modules/logos_page/GitHub-Mark.png",
+    )
 
-# Fetch PR details
-pr_response = requests.get(pr_api_url, headers=headers)
-if pr_response.status_code != 200:
-    print(f"Failed to fetch PR details. Status Code: {pr_response.status_code}")
-    print(f"Response: {pr_response.text}")
-    exit(1)
-
-pr_data = pr_response.json()
-labels = [label["name"] for label in pr_data.get("labels", [])]
-pr_title = pr_data.get("title", "Pull Request")
-pr_url = pr_data.get("html_url", f"https://github.com/{repository}/pull/{pr_number}")
-
-# Fetch GitHub user details
-user_response = requests.get(user_api_url, headers=headers)
-if user_response.status_code != 200:
-    print(f"Failed to fetch user details. Status Code: {user_response.status_code}")
-    print(f"Response: {user_response.text}")
-    exit(1)
-
-user_data = user_response.json()
-profile_picture = user_data.get(
-    "avatar_url",
-    "https://github.githubassets.com/images/modules/logos_page/GitHub-Mark.png",
-)
-
-# Check if 'database' label is present
-if "database" in labels:
     # Get Slack user ID from mapping
     slack_user_id = slack_mapping["mappings"].get(pr_user, None)
     if slack_user_id:
@@ -108,5 +152,7 @@ if "database" in labels:
         exit(1)
     else:
         print("Notification sent to Slack.")
-else:
-    print("No 'database' label found. No notification sent.")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,36 +48,56 @@ def fetch_and_log_prs(start_date, end_date):
             )
             return
 
-    # Make API request to fetch closed PRs from the repository
-    response = requests.get(
-        f"https://api.github.com/repos/{repo}/pulls?state=closed", headers=headers
-    )
-    prs = response.json()
+    # Let the search API return only PRs merged within the date range
+    since_str = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+    until_str = until.strftime("%Y-%m-%dT%H:%M:%SZ")
+    query = f"repo:{repo} is:pr is:merged merged:{since_str}..{until_str}"
 
-    # Filter PRs that were merged within the specified date range
-    merged_prs = [
-        pr
-        for pr in prs
-        if pr.get("merged_at")  # Only consider PRs that were actually merged
-        and since
-        <= datetime.strptime(pr["merged_at"], "%Y-%m-%dT%H:%M:%SZ")
-        <= until  # Check if PR was merged within date range
-    ]
+    merged_prs = []
+    page = 1
+    while True:
+        response = requests.get(
+            "https://api.github.com/search/issues",
+            headers=headers,
+            params={"q": query, "per_page": 100, "page": page},
+        )
+        response.raise_for_status()
+        result = response.json()
+        if result.get("incomplete_results"):
+            print("Warning: GitHub search timed out; the log may be missing PRs.")
+        for item in result.get("items", []):
+            # Search results carry merged_at under pull_request; closed_at is the
+            # same moment for merged PRs
+            merged_at = (
+                item.get("pull_request", {}).get("merged_at") or item["closed_at"]
+            )
+            # Parse the timestamp once, with the C-implemented fromisoformat
+            merged_prs.append(
+                (datetime.fromisoformat(merged_at.rstrip("Z")), item["title"])
+            )
+        # The search API serves at most 1000 results; asking past them fails
+        total_count = result.get("total_count", 0)
+        if not result.get("items") or page * 100 >= min(total_count, 1000):
+            if total_count > 1000:
+                print(
+                    f"Warning: {total_count} PRs match, but GitHub search returns "
+                    "at most 1000; narrow the date range to log them all."
+                )
+            break
+        page += 1
 
-    # Write the results to a log file
-    with open("merged_prs.log", "w") as log_file:
+    # Write the results to a log file in a single buffered write
+    with open("merged_prs.log", "w", buffering=1 << 16) as log_file:
         if merged_prs:
-            # Write header with date range
-            log_file.write(
-                f"Merged PRs between {since.strftime('%Y-%m-%d')} and {until.strftime('%Y-%m-%d')}:\n"
+            # Header with date range, then PR title and merge time per PR
+            lines = [
+                f"Merged PRs between {since.strftime('%Y-%m-%d')} and {until.strftime('%Y-%m-%d')}:"
+            ]
+            lines.extend(
+                f"- {title} (Merged at: {merged_at:%Y-%m-%d | %H:%M})"
+                for merged_at, title in merged_prs
             )
-            # Write details for each merged PR
-            for pr in merged_prs:
-                # Format the merge timestamp
-                merged_at = datetime.strptime(pr["merged_at"], "%Y-%m-%dT%H:%M:%SZ")
-                merged_at_str = merged_at.strftime("%Y-%m-%d | %H:%M")
-                # Log PR title and merge time
-                log_file.write(f"- {pr['title']} (Merged at: {merged_at_str})\n")
+            log_file.write("\n".join(lines) + "\n")
         else:
             # No PRs found in the date range
             log_file.write(
@@ -85,8 +105,8 @@ def fetch_and_log_prs(start_date, end_date):
             )
 
 
-if __name__ == "__main__":
-    # Script is being run directly (not imported)
+def main():
+    """Log merged PRs for the date range given on the command line."""
     # Use the first and second arguments passed to the script as the start and end dates
     start_date = (
         sys.argv[1] if len(sys.argv) > 1 else "yesterday"
@@ -95,3 +115,8 @@ if __name__ == "__main__":
         sys.argv[2] if len(sys.argv) > 2 else "today"
     )  # Default to "today" if not provided
     fetch_and_log_prs(start_date, end_date)
+
+
+if __name__ == "__main__":
+    # Script is being run directly (not imported)
+    sys.exit(main())
@@ -1,19 +1,69 @@
 import os
+import re
 import json
 import time
+import fnmatch
+import functools
+from pathlib import Path
 import requests
-from github import Github
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson parses and serializes several times faster; fall back to the stdlib
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+
 
 # Load environment variables
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
 REPO = os.getenv("GITHUB_REPOSITORY")
 USE_CODEOWNERS = os.getenv("USE_CODEOWNERS", "false").lower() == "true"
-
-github = Github(GITHUB_TOKEN)
-repo = github.get_repo(REPO)
-
-
+# Set by GitHub Actions when a run is re-run with debug logging
+DEBUG = os.getenv("RUNNER_DEBUG") == "1"
+# Workflows whose completion triggers this script (workflow_run event); only
+# the last of them to finish for a commit sends the notification
+NOTIFY_AFTER_WORKFLOWS = frozenset(
+    name.strip()
+    for name in os.getenv("NOTIFY_AFTER_WORKFLOWS", "").split(",")
+    if name.strip()
+)
+# Locations GitHub looks for CODEOWNERS in, read from the checked-out tree
+CODEOWNERS_PATHS = ("CODEOWNERS", ".github/CODEOWNERS", "docs/CODEOWNERS")
+
+# Polling for required workflows: back off from 15s up to 2 minutes, for at
+# most an hour in total
+INITIAL_POLL_DELAY = 15
+MAX_POLL_DELAY = 120
+MAX_WAIT_SECONDS = 60 * 60
+
+# Shared keep-alive session for GitHub API calls; the Slack webhook is posted
+# separately so the token never leaves api.github.com
+SESSION = requests.Session()
+SESSION.headers.update({"Authorization": f"bearer {GITHUB_TOKEN}"})
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    ),
+)
+
+
+@functools.lru_cache(maxsize=1)
 def load_required_workflows():
     """Load required workflows from a JSON file."""
     workflow_path = ".github/workflows.json"
@@ -24,7 +74,7 @@ def load_required_workflows():
 
     try:
         with open(workflow_path, "r") as f:
-            data = json.load(f)
+            data = json_loads(f.read())
             workflows = data.get("required_workflows", [])
             print(f"Loaded Required Workflows: {workflows}")
             return workflows
@@ -35,17 +85,18 @@ def load_required_workflows():
     return []
 
 
-# Load required workflows
-REQUIRED_WORKFLOWS = load_required_workflows()
+# Load required workflows, as a set for constant-time membership tests
+REQUIRED_WORKFLOWS = frozenset(load_required_workflows())
 
 
 def get_event_data():
     """Read GitHub event data from the provided event path."""
     event_path = os.getenv("GITHUB_EVENT_PATH")
     with open(event_path, "r") as f:
-        return json.load(f)
+        return json_loads(f.read())
 
 
+@functools.lru_cache(maxsize=1)
 def load_slack_user_map():
     """Load GitHub-to-Slack username mappings from JSON file."""
     mapping_path = ".github/slack-mapping.json"
@@ -56,7 +107,7 @@ def load_slack_user_map():
 
     try:
         with open(mapping_path, "r") as f:
-            data = json.load(f)
+            data = json_loads(f.read())
             mappings = data.get("mappings", {})
             print(f"Loaded Slack Mapping: {mappings}")
             return mappings
@@ -67,86 +118,254 @@ def load_slack_user_map():
     return {}
 
 
+def compile_codeowners_pattern(path):
+    """Compile a CODEOWNERS path to a regex matching the path and anything below it."""
+    directory = path.strip("/")
+    return re.compile(
+        f"{fnmatch.translate(directory)}|{fnmatch.translate(directory + '/*')}"
+    )
+
+
+@functools.lru_cache(maxsize=1)
 def get_codeowners():
-    """Retrieve CODEOWNERS file and extract user mentions."""
+    """
+    Read CODEOWNERS from the checkout and extract user mentions.
+    Returns (compiled pattern, owners) pairs, last rule first, so the first
+    match for a file is the rule that wins under CODEOWNERS semantics.
+    """
     try:
-        codeowners_file = repo.get_contents("CODEOWNERS").decoded_content.decode()
-        codeowners = {}
-        for line in codeowners_file.splitlines():
+        for location in CODEOWNERS_PATHS:
+            codeowners_path = Path(location)
+            if codeowners_path.is_file():
+                break
+        else:
+            print("Warning: CODEOWNERS not found.")
+            return ()
+
+        codeowners = []
+        for line in codeowners_path.read_text().splitlines():
             # Ignore blank lines and comments
             if line.strip() and not line.startswith("#"):
                 parts = line.strip().split()
                 if len(parts) > 1:
-                    owners = [user.replace("@", "") for user in parts[1:]]
-                    codeowners[parts[0]] = owners
-        return codeowners
+                    owners = tuple(user.replace("@", "") for user in parts[1:])
+                    codeowners.append((compile_codeowners_pattern(parts[0]), owners))
+        return tuple(reversed(codeowners))
     except Exception as e:
         print(f"Warning: Error loading CODEOWNERS: {str(e)}")
-        return {}
+        return ()
 
 
 def get_changed_files(pr_number):
-    """Fetch changed files for a pull request."""
-    pr = repo.get_pull(pr_number)
-    files = pr.get_files()
-    return [file.filename for file in files]
+    """Fetch changed files for a pull request, following pagination."""
+    response = SESSION.get(
+        f"https://api.github.com/repos/{REPO}/pulls/{pr_number}/files",
+        params={"per_page": 100},
+    )
+    response.raise_for_status()
+    files = [file["filename"] for file in json_loads(response.content)]
+    while "next" in response.links:
+        response = SESSION.get(response.links["next"]["url"])
+        response.raise_for_status()
+        files.extend(file["filename"] for file in json_loads(response.content))
+    return files
 
 
-def check_actions_finished(pr_data):
+def get_check_runs(repo_full_name, head_sha, etag=None):
     """
-    Verifies that specific GitHub actions have finished.
-    Returns True only if all required workflows have completed successfully.
+    Fetch all check runs for a commit, following pagination.
+    Returns (check_runs, etag); check_runs is None when GitHub answers
+    304 Not Modified for the given ETag, which costs no rate limit.
+    The first page's ETag doesn't cover later pages, so no ETag is returned
+    when there is more than one page.
     """
-    try:
-        workflow_token = os.getenv("GITHUB_TOKEN")
-        pr_number = pr_data["pull_request"]["number"]
-        head_sha = pr_data["pull_request"]["head"]["sha"]
-        repo_full_name = pr_data["repository"]["full_name"]
+    checks_url = (
+        f"https://api.github.com/repos/{repo_full_name}/commits/{head_sha}/check-runs"
+    )
+    headers = {"If-None-Match": etag} if etag else {}
+    response = SESSION.get(checks_url, params={"per_page": 100}, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    if response.status_code != 200:
+        raise RuntimeError(f"Error fetching check runs: {response.status_code}")
+    etag = response.headers.get("ETag")
+
+    check_runs = []
+    while True:
+        check_runs.extend(
+            {
+                "name": run.get("name", ""),
+                "status": run.get("status", ""),
+                "conclusion": run.get("conclusion", ""),
+            }
+            for run in json_loads(response.content).get("check_runs", [])
+        )
+        if "next" not in response.links:
+            return check_runs, etag
+        etag = None
+        response = SESSION.get(response.links["next"]["url"])
+        if response.status_code != 200:
+            raise RuntimeError(f"Error fetching check runs: {response.status_code}")
 
-        headers = {
-            "Authorization": f"token {workflow_token}",
-            "Accept": "application/vnd.github.v3+json",
-        }
 
-        api_base = "https://api.github.com"
-        retries = 0
-        max_retries = 120
+def get_workflow_run_pr(event_data):
+    """
+    Build pull_request event data for the PR behind a workflow_run event.
+    Returns None when the run isn't associated with an open PR of this
+    repository.
+    """
+    workflow_run = event_data["workflow_run"]
+    pull_requests = workflow_run.get("pull_requests") or []
+    if pull_requests:
+        response = SESSION.get(
+            f"https://api.github.com/repos/{REPO}/pulls/{pull_requests[0]['number']}"
+        )
+        response.raise_for_status()
+        pull_request = json_loads(response.content)
+    else:
+        # pull_requests is empty for PRs from forks, so look the PR up by its
+        # head branch instead
+        head_owner = (workflow_run.get("head_repository") or {}).get("owner") or {}
+        if not head_owner.get("login"):
+            return None
+        response = SESSION.get(
+            f"https://api.github.com/repos/{REPO}/pulls",
+            params={
+                "head": f"{head_owner['login']}:{workflow_run['head_branch']}",
+                "state": "open",
+            },
+        )
+        response.raise_for_status()
+        pull_request = next(
+            (
+                pr
+                for pr in json_loads(response.content)
+                if pr["head"]["sha"] == workflow_run["head_sha"]
+            ),
+            None,
+        )
+        if pull_request is None:
+            return None
 
-        while retries < max_retries:
-            retries += 1
-            checks_url = (
-                f"{api_base}/repos/{repo_full_name}/commits/{head_sha}/check-runs"
-            )
-            checks_response = requests.get(checks_url, headers=headers)
+    return {"pull_request": pull_request, "repository": event_data["repository"]}
+
+
+def get_trigger_runs(workflow_run):
+    """
+    List the runs of NOTIFY_AFTER_WORKFLOWS for the commit of a workflow_run
+    event, following pagination. Without NOTIFY_AFTER_WORKFLOWS only the
+    triggering run counts.
+    """
+    if not NOTIFY_AFTER_WORKFLOWS:
+        return [workflow_run]
+
+    response = SESSION.get(
+        f"https://api.github.com/repos/{REPO}/actions/runs",
+        params={"head_sha": workflow_run["head_sha"], "per_page": 100},
+    )
+    response.raise_for_status()
+    runs = json_loads(response.content).get("workflow_runs", [])
+    while "next" in response.links:
+        response = SESSION.get(response.links["next"]["url"])
+        response.raise_for_status()
+        runs.extend(json_loads(response.content).get("workflow_runs", []))
+    return [run for run in runs if run["name"] in NOTIFY_AFTER_WORKFLOWS]
 
-            if checks_response.status_code != 200:
-                print(f"Error fetching check runs: {checks_response.status_code}")
-                time.sleep(30)
-                continue
 
-            check_runs = checks_response.json().get("check_runs", [])
-            workflows = {workflow: False for workflow in REQUIRED_WORKFLOWS}
+def is_last_workflow_run(workflow_run, runs):
+    """
+    Check whether this is the last of the trigger workflow runs to finish for
+    its commit, so that exactly one of their workflow_run events notifies.
+    """
+    if not runs:
+        print(
+            "No runs of NOTIFY_AFTER_WORKFLOWS "
+            f"({', '.join(sorted(NOTIFY_AFTER_WORKFLOWS))}) found for "
+            f"{workflow_run['head_sha']}. Skipping."
+        )
+        return False
+    if any(run["status"] != "completed" for run in runs):
+        print("Other workflows are still pending. Skipping.")
+        return False
+    last_run = max(runs, key=lambda run: (run["updated_at"], run["id"]))
+    if last_run["id"] != workflow_run["id"]:
+        print(f"{last_run['name']} finished later and will notify. Skipping.")
+        return False
+    return True
 
-            for check in check_runs:
-                name = check.get("name", "")
-                status = check.get("status", "")
-                conclusion = check.get("conclusion", "")
 
-                if (
-                    name in REQUIRED_WORKFLOWS
-                    and status == "completed"
-                    and conclusion == "success"
-                ):
-                    workflows[name] = True
+def get_job_names(runs):
+    """
+    Collect the job names of the given workflow runs, which are the names of
+    the check runs they produce.
+    """
+    names = set()
+    for run in runs:
+        response = SESSION.get(
+            f"https://api.github.com/repos/{REPO}/actions/runs/{run['id']}/jobs",
+            params={"per_page": 100},
+        )
+        response.raise_for_status()
+        names.update(job["name"] for job in json_loads(response.content)["jobs"])
+        while "next" in response.links:
+            response = SESSION.get(response.links["next"]["url"])
+            response.raise_for_status()
+            names.update(job["name"] for job in json_loads(response.content)["jobs"])
+    return names
 
-            if all(workflows.values()):
-                print("All required workflows have completed successfully!")
-                return True
 
-            print("Not all actions have completed, waiting for 30 seconds...")
-            time.sleep(30)
+def check_actions_finished(pr_data, poll=True, required=REQUIRED_WORKFLOWS):
+    """
+    Verifies that specific GitHub actions have finished.
+    Returns True only if all required workflows have completed successfully.
+    Polls with a growing delay, backing off further while nothing changes;
+    with poll=False the check runs are inspected once.
+    """
+    try:
+        head_sha = pr_data["pull_request"]["head"]["sha"]
+        repo_full_name = pr_data["repository"]["full_name"]
 
-        print("Max retries reached, aborting.")
+        delay = INITIAL_POLL_DELAY
+        deadline = time.monotonic() + MAX_WAIT_SECONDS
+        etag = None
+
+        while time.monotonic() < deadline:
+            unchanged = False
+            remaining = None
+            try:
+                check_runs, etag = get_check_runs(repo_full_name, head_sha, etag)
+            except RuntimeError as e:
+                print(str(e))
+            else:
+                if check_runs is None:
+                    # 304 Not Modified: nothing changed since the last poll
+                    unchanged = True
+                else:
+                    remaining = set(required)
+
+                    for check in check_runs:
+                        if (
+                            check["status"] == "completed"
+                            and check["conclusion"] == "success"
+                        ):
+                            remaining.discard(check["name"])
+                        if not remaining:
+                            break
+
+                    if not remaining:
+                        print("All required workflows have completed successfully!")
+                        return True
+
+            if not poll:
+                if remaining:
+                    print(f"Required checks not successful: {sorted(remaining)}")
+                return False
+
+            print(f"Not all actions have completed, waiting for {delay:.0f} seconds...")
+            time.sleep(delay)
+            delay = min(delay * (2 if unchanged else 1.5), MAX_POLL_DELAY)
+
+        print("Max wait time reached, aborting.")
         return False
 
     except Exception as e:
@@ -168,20 +387,27 @@ def format_pr_created_message(pr_data, codeowners, slack_user_map):
         r["login"] for r in pr_data["pull_request"].get("requested_reviewers", [])
     )
 
-    if USE_CODEOWNERS:
-        changed_files = get_changed_files(pr_number)
-        for path, owners in codeowners.items():
-            if any(file.startswith(path) for file in changed_files):
-                notify_users.update(owners)
+    # Changed files are only fetched when some code owner isn't notified yet
+    if USE_CODEOWNERS and any(
+        not notify_users.issuperset(owners) for _, owners in codeowners
+    ):
+        # The last matching rule in CODEOWNERS owns each file
+        for file in get_changed_files(pr_number):
+            for pattern, owners in codeowners:
+                if pattern.match(file):
+                    notify_users.update(owners)
+                    break
 
     slack_mentions, unmapped_users = convert_to_slack_mentions(
         notify_users, slack_user_map
     )
+    if unmapped_users:
+        print(f"No Slack mapping for: {', '.join(sorted(unmapped_users))}")
 
     # Format the message as a single line
-    notification_line = f"*<{pr_url}|PR #{pr_number}: {pr_title}>*"
-    if slack_mentions:
-        notification_line += f" - Notifying: {' '.join(slack_mentions)}"
+    notification_line = f"*<{pr_url}|PR #{pr_number}: {pr_title}>*" + (
+        f" - Notifying: {slack_mentions}" if slack_mentions else ""
+    )
 
     message = {
         "blocks": [
@@ -199,41 +425,33 @@ def format_pr_created_message(pr_data, codeowners, slack_user_map):
 
 
 def convert_to_slack_mentions(github_users, slack_user_map):
-    """Convert GitHub usernames to Slack mentions."""
-    slack_mentions = []
-    unmapped_users = []
-
-    for github_user in github_users:
-        slack_id = slack_user_map.get(github_user)
-        if slack_id:
-            slack_mentions.append(f"<@{slack_id}>")
-        else:
-            unmapped_users.append(github_user)
+    """
+    Convert GitHub usernames to a space-separated string of Slack mentions.
+    Unmapped users are only collected when debug logging is enabled.
+    """
+    slack_mentions = " ".join(
+        f"<@{slack_user_map[github_user]}>"
+        for github_user in github_users
+        if slack_user_map.get(github_user)
+    )
+    unmapped_users = (
+        [user for user in github_users if not slack_user_map.get(user)] if DEBUG else []
+    )
 
     return slack_mentions, unmapped_users
 
 
-def get_github_avatar_url(username):
-    """Fetch GitHub avatar URL for a given username."""
-    try:
-        user = github.get_user(username)
-        return user.avatar_url
-    except Exception as e:
-        print(f"Error fetching avatar for {username}: {str(e)}")
-        return None
-
-
 def send_slack_notification(message, username):
-    """Send Slack notification using webhook with custom username and avatar."""
+    """Send Slack notification using webhook with custom username and icon."""
     try:
-        avatar_url = get_github_avatar_url(username)
         message["username"] = username
-
-        if avatar_url:
-            message["icon_url"] = avatar_url
+        # A Slack emoji needs no image fetch per message, unlike an avatar URL
+        message["icon_emoji"] = ":github:"
 
         headers = {"Content-Type": "application/json"}
-        response = requests.post(SLACK_WEBHOOK_URL, json=message, headers=headers)
+        response = requests.post(
+            SLACK_WEBHOOK_URL, data=json_dumps(message), headers=headers
+        )
         response.raise_for_status()
         print("Successfully sent Slack notification")
     except requests.exceptions.RequestException as e:
@@ -242,14 +460,41 @@ def send_slack_notification(message, username):
 
 if __name__ == "__main__":
     event_data = get_event_data()
-    slack_user_map = load_slack_user_map()
-    pr_creator = event_data["pull_request"]["user"]["login"]
-    codeowners = get_codeowners() if USE_CODEOWNERS else {}
 
-    if check_actions_finished(event_data):
-        slack_message = format_pr_created_message(
-            event_data, codeowners, slack_user_map
+    if "workflow_run" in event_data:
+        # Triggered once the PR's workflows finished, so check once, no polling
+        workflow_run = event_data["workflow_run"]
+        pr_data = get_workflow_run_pr(event_data)
+        if pr_data is None:
+            print(
+                f"No open pull request in {REPO} has head {workflow_run['head_sha']}"
+                f" ({workflow_run['head_branch']}). Skipping."
+            )
+            exit(0)
+        trigger_runs = get_trigger_runs(workflow_run)
+        if not is_last_workflow_run(workflow_run, trigger_runs):
+            exit(0)
+        # Only the checks of the trigger workflows are known to be done; other
+        # required workflows may still be running or never run on this event
+        required = REQUIRED_WORKFLOWS & get_job_names(trigger_runs)
+        if REQUIRED_WORKFLOWS - required:
+            print(
+                "Not produced by the trigger workflows, not checked: "
+                f"{sorted(REQUIRED_WORKFLOWS - required)}"
+            )
+        actions_finished = check_actions_finished(
+            pr_data, poll=False, required=required
         )
+    else:
+        pr_data = event_data
+        actions_finished = check_actions_finished(pr_data)
+
+    slack_user_map = load_slack_user_map()
+    pr_creator = pr_data["pull_request"]["user"]["login"]
+    codeowners = get_codeowners() if USE_CODEOWNERS else ()
+
+    if actions_finished:
+        slack_message = format_pr_created_message(pr_data, codeowners, slack_user_map)
         send_slack_notification(slack_message, pr_creator)
     else:
         print("Required actions not completed. Aborting notification.")
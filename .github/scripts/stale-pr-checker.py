@@ -1,16 +1,118 @@
 import os
 import sys
 import json
+import time
+import fcntl
+import threading
 import requests
 import logging
-from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Any, Iterator
+
+# orjson parses and serializes several times faster; fall back to the stdlib
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# ETags and bodies of REST GETs, so unchanged resources come back as a free
+# 304 Not Modified; shared across runs through actions/cache
+ETAG_CACHE_PATH = os.path.expanduser("~/.cache/stale-pr/etags.json")
+
+DEFAULT_STALE_COMMENT = (
+    "@{creator} This PR has been open for {age} days, "
+    "please provide an update on its status."
+)
+
+# Open PRs with everything the stale check needs, oldest first, 100 per page.
+# The first page also resolves the stale label's node ID
+OPEN_PRS_QUERY = """
+query($owner: String!, $repo: String!, $cursor: String, $label: String!, $withLabel: Boolean!) {
+  repository(owner: $owner, name: $repo) {
+    label(name: $label) @include(if: $withLabel) {
+      id
+    }
+    pullRequests(
+      states: OPEN
+      first: 100
+      after: $cursor
+      orderBy: {field: CREATED_AT, direction: ASC}
+    ) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        id
+        number
+        createdAt
+        url
+        author {
+          login
+        }
+        labels(first: 100) {
+          nodes {
+            name
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Below this many remaining requests, wait for the rate limit window to reset
+RATE_LIMIT_THRESHOLD = 50
+
+# GraphQL requests are POSTs, which the adapter never retries, so graphql()
+# retries them itself: rate-limited requests (GitHub rejects those unprocessed)
+# and, for read-only queries, transient server errors
+GRAPHQL_ATTEMPTS = 4
+GRAPHQL_BACKOFF = 2.0
+
+# Slack accepts at most 50 blocks per message
+SLACK_MAX_BLOCKS = 50
+
+# Comment on and label a stale PR in a single round trip
+NOTIFY_MUTATION = """
+mutation($id: ID!, $body: String!, $labelIds: [ID!]!) {
+  addComment(input: {subjectId: $id, body: $body}) {
+    clientMutationId
+  }
+  addLabelsToLabelable(input: {labelableId: $id, labelIds: $labelIds}) {
+    clientMutationId
+  }
+}
+"""
+
+
+class RateLimitRetry(Retry):
+    """
+    Retry that also honours Retry-After on a 403, which is how GitHub signals
+    secondary rate limits. A 403 without it is a real permission error and is
+    not retried.
+    """
+
+    RETRY_AFTER_STATUS_CODES = Retry.RETRY_AFTER_STATUS_CODES | {403}
 
 
 @dataclass
 class PullRequest:
     id: int
+    node_id: str
     creator: str
     url: str
     created_at: datetime
@@ -18,11 +120,45 @@ class PullRequest:
     labels: List[str]
 
 
+def strptime_utc(value: str) -> datetime:
+    """Parse a GitHub "YYYY-MM-DDTHH:MM:SSZ" timestamp as an aware UTC datetime."""
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+# fromisoformat only accepts the trailing "Z" from Python 3.11 on
+parse_timestamp = (
+    datetime.fromisoformat if sys.version_info >= (3, 11) else strptime_utc
+)
+
+
+def load_etag_cache() -> Dict[str, Dict[str, Any]]:
+    """Load the ETag cache, holding a shared lock against concurrent writers."""
+    try:
+        with open(ETAG_CACHE_PATH, "r") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            return json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_etag_cache(cache: Dict[str, Dict[str, Any]]) -> None:
+    """Write the ETag cache, holding an exclusive lock while writing."""
+    try:
+        os.makedirs(os.path.dirname(ETAG_CACHE_PATH), exist_ok=True)
+        with open(ETAG_CACHE_PATH, "ab+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            f.truncate()
+            f.write(json_dumps(cache))
+    except OSError as e:
+        logging.warning(f"Failed to write ETag cache: {str(e)}")
+
+
 def load_slack_mappings() -> Dict[str, str]:
     """Load Slack user mappings from .github/slack-mapping.json."""
     try:
         with open(".github/slack-mapping.json", "r") as f:
-            data = json.load(f)
+            data = json_loads(f.read())
             return data.get("mappings", {})
     except Exception as e:
         logging.error(f"Failed to load Slack mappings: {str(e)}")
@@ -34,7 +170,13 @@ class GitHubPRMonitor:
         self.github_token = os.getenv("GITHUB_TOKEN")
         self.repo = os.getenv("REPO")
         self.stale_days = int(os.getenv("STALE_DAYS", "3"))
+        self.stale_label = os.getenv("STALE_LABEL", "stale")
+        # Comment template, formatted with the PR's {creator} and {age}
+        self.stale_comment = os.getenv("STALE_COMMENT", DEFAULT_STALE_COMMENT)
         self.slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+        self.max_workers = 16
+        # Node IDs passed as labelIds to every notify mutation, built once
+        self.stale_label_ids = []
 
         if not all([self.github_token, self.repo]):
             raise ValueError(
@@ -46,6 +188,27 @@ class GitHubPRMonitor:
             "Accept": "application/vnd.github.v3+json",
         }
 
+        # Keep-alive session for all GitHub API calls, retrying transient errors.
+        # Everything goes to api.github.com, so one pool holding up to two
+        # connections per worker thread lets every worker reuse a connection
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=self.max_workers,
+                pool_maxsize=2 * self.max_workers,
+                max_retries=RateLimitRetry(
+                    total=5,
+                    backoff_factor=2.0,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    respect_retry_after_header=True,
+                ),
+            ),
+        )
+        # Separate keep-alive session for the Slack webhook, without the token
+        self.slack_session = requests.Session()
+
         logging.basicConfig(
             level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
         )
@@ -54,15 +217,158 @@ class GitHubPRMonitor:
         # Load Slack mappings
         self.slack_mappings = load_slack_mappings()
 
-    def get_pull_requests(self) -> List[Dict]:
-        """Fetch all open pull requests."""
-        pr_url = f"https://api.github.com/repos/{self.repo}/pulls?state=open"
-        self.logger.info(f"Fetching PRs from: {pr_url}")
-        response = requests.get(pr_url, headers=self.headers)
+        # Only entries requested during this run are written back, so the
+        # cache doesn't grow with PRs that have since been closed
+        self.etag_cache = load_etag_cache()
+        self.etag_cache_used = {}
+        self.etag_lock = threading.Lock()
+
+        # Slack blocks per notified PR, sent together once all PRs are processed
+        self.pending_slack_blocks = []
+        self.slack_lock = threading.Lock()
+
+    @staticmethod
+    def _header_int(response: requests.Response, name: str) -> Optional[int]:
+        """Read an integer response header, or None if missing or malformed."""
+        try:
+            return int(response.headers[name])
+        except (KeyError, ValueError):
+            return None
+
+    def _sleep_until_reset(self, response: requests.Response, reason: str) -> None:
+        """Sleep until X-RateLimit-Reset, or a minute if GitHub didn't say."""
+        reset = self._header_int(response, "X-RateLimit-Reset")
+        delay = max(0, reset - time.time()) + 1 if reset is not None else 60
+        self.logger.warning(f"{reason}, waiting {delay:.0f}s for reset")
+        time.sleep(delay)
+
+    def _check_rate_limit(self, response: requests.Response) -> None:
+        """Sleep until the rate limit resets when few requests are left."""
+        remaining = self._header_int(response, "X-RateLimit-Remaining")
+        if remaining is not None and remaining < RATE_LIMIT_THRESHOLD:
+            self._sleep_until_reset(response, f"Only {remaining} API requests left")
+
+    def _wait_if_rate_limited(self, response: requests.Response) -> bool:
+        """
+        If the response is a rate-limit rejection (403/429 with Retry-After or
+        no requests remaining), wait it out and return True.
+        """
+        if response.status_code not in (403, 429):
+            return False
+        retry_after = self._header_int(response, "Retry-After")
+        if retry_after is not None:
+            self.logger.warning(f"Rate limited, retrying after {retry_after}s")
+            time.sleep(retry_after)
+            return True
+        if self._header_int(response, "X-RateLimit-Remaining") == 0:
+            self._sleep_until_reset(response, "Rate limit exhausted")
+            return True
+        return False
+
+    def cached_get(self, url: str) -> Tuple[int, Any]:
+        """
+        GET a JSON resource, revalidating the cached copy with If-None-Match.
+        Returns (status code, body); a 304 is served from the cache as a 200.
+        """
+        with self.etag_lock:
+            cached = self.etag_cache.get(url)
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        response = self.session.get(url, headers=headers)
+        # The adapter retries Retry-After responses; an exhausted primary
+        # limit needs waiting until the reset
+        if self._wait_if_rate_limited(response):
+            response = self.session.get(url, headers=headers)
+        self._check_rate_limit(response)
+        if response.status_code == 304 and cached:
+            with self.etag_lock:
+                self.etag_cache_used[url] = cached
+            return 200, cached["body"]
+        if response.status_code != 200:
+            return response.status_code, None
+
+        body = json_loads(response.content)
+        etag = response.headers.get("ETag")
+        if etag:
+            with self.etag_lock:
+                self.etag_cache_used[url] = {"etag": etag, "body": body}
+        return 200, body
+
+    def graphql(self, query: str, variables: Dict, read_only: bool = False) -> Dict:
+        """
+        Run a GraphQL query or mutation and return its data.
+        Rate-limited requests are retried after waiting; read-only queries are
+        also retried on transient server errors.
+        """
+        for attempt in range(GRAPHQL_ATTEMPTS):
+            last_attempt = attempt == GRAPHQL_ATTEMPTS - 1
+            response = self.session.post(
+                GRAPHQL_URL, json={"query": query, "variables": variables}
+            )
+            if not last_attempt:
+                if self._wait_if_rate_limited(response):
+                    continue
+                if read_only and response.status_code in (500, 502, 503, 504):
+                    time.sleep(GRAPHQL_BACKOFF * 2**attempt)
+                    continue
+            response.raise_for_status()
+            self._check_rate_limit(response)
+
+            result = json_loads(response.content)
+            errors = result.get("errors")
+            if (
+                errors
+                and not last_attempt
+                and any(error.get("type") == "RATE_LIMITED" for error in errors)
+            ):
+                self._sleep_until_reset(response, "GraphQL rate limit reached")
+                continue
+            if errors:
+                raise RuntimeError(f"GraphQL request failed: {errors}")
+            return result["data"]
+
+    def create_label(self, name: str) -> str:
+        """Create a label and return its node ID."""
+        response = self.session.post(
+            f"https://api.github.com/repos/{self.repo}/labels", json={"name": name}
+        )
         response.raise_for_status()
-        prs = response.json()
-        self.logger.info(f"Found {len(prs)} open PRs")
-        return prs
+        self.logger.info(f"Created label '{name}'")
+        return json_loads(response.content)["node_id"]
+
+    def get_pull_requests(self) -> Iterator[Dict]:
+        """
+        Yield open pull requests with their labels, oldest first, via paginated
+        GraphQL. Pages are fetched lazily, so a caller that stops iterating
+        skips the remaining pages. The stale label's node ID is set from the
+        first page, before any PR is yielded.
+        """
+        self.logger.info(f"Fetching open PRs for {self.repo}")
+        owner, name = self.repo.split("/", 1)
+        cursor = None
+        while True:
+            first_page = cursor is None
+            data = self.graphql(
+                OPEN_PRS_QUERY,
+                {
+                    "owner": owner,
+                    "repo": name,
+                    "cursor": cursor,
+                    "label": self.stale_label,
+                    "withLabel": first_page,
+                },
+                read_only=True,
+            )
+            if first_page:
+                label = data["repository"]["label"]
+                self.stale_label_ids = [
+                    label["id"] if label else self.create_label(self.stale_label)
+                ]
+            page = data["repository"]["pullRequests"]
+            self.logger.info(f"Fetched {len(page['nodes'])} open PRs")
+            yield from page["nodes"]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            cursor = page["pageInfo"]["endCursor"]
 
     def determine_stale_reason(self, pr: PullRequest) -> str:
         """Determine the reason why a PR is considered stale."""
@@ -72,9 +378,8 @@ class GitHubPRMonitor:
         check_runs_url = (
             f"https://api.github.com/repos/{self.repo}/pulls/{pr.id}/check-runs"
         )
-        response = requests.get(check_runs_url, headers=self.headers)
-        if response.status_code == 200:
-            check_runs_data = response.json()
+        status, check_runs_data = self.cached_get(check_runs_url)
+        if status == 200:
             failed_checks = [
                 run
                 for run in check_runs_data.get("check_runs", [])
@@ -85,9 +390,8 @@ class GitHubPRMonitor:
 
         # Check for pending reviews
         reviews_url = f"https://api.github.com/repos/{self.repo}/pulls/{pr.id}/reviews"
-        response = requests.get(reviews_url, headers=self.headers)
-        if response.status_code == 200:
-            review_data = response.json()
+        status, review_data = self.cached_get(reviews_url)
+        if status == 200:
             pending_reviews = any(
                 review["state"] in ["PENDING", "CHANGES_REQUESTED"]
                 for review in review_data
@@ -99,26 +403,16 @@ class GitHubPRMonitor:
 
     def notify_pr(self, pr: PullRequest) -> None:
         """Add comment and label to PR."""
-        comment_url = (
-            f"https://api.github.com/repos/{self.repo}/issues/{pr.id}/comments"
-        )
-        comment = {
-            "body": f"@{pr.creator} This PR has been open for {pr.age} days, please provide an update on its status."
-        }
-        response = requests.post(comment_url, headers=self.headers, json=comment)
-        response.raise_for_status()
-
-        # Add label
-        labels_url = f"https://api.github.com/repos/{self.repo}/issues/{pr.id}/labels"
-        response = requests.post(
-            labels_url, headers=self.headers, json={"labels": ["stale"]}
+        body = self.stale_comment.format(creator=pr.creator, age=pr.age)
+        self.graphql(
+            NOTIFY_MUTATION,
+            {"id": pr.node_id, "body": body, "labelIds": self.stale_label_ids},
         )
-        response.raise_for_status()
 
         self.logger.info(f"Notified PR #{pr.id}")
 
-    def send_slack_notification(self, pr: PullRequest) -> None:
-        """Send notification to Slack."""
+    def queue_slack_notification(self, pr: PullRequest) -> None:
+        """Queue a Slack block for the PR, to be sent by send_slack_notifications."""
         if not self.slack_webhook_url:
             self.logger.info(
                 "No Slack webhook URL configured, skipping Slack notification"
@@ -129,59 +423,122 @@ class GitHubPRMonitor:
         mention = f"<@{slack_user_id}>" if slack_user_id else f"@{pr.creator}"
         reason = self.determine_stale_reason(pr)
 
-        slack_payload = {
-            "text": f"🚨 Stale PR <{pr.url}|#{pr.id}> Alert",
-            "blocks": [
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": (
-                            f"*🚨 Stale PR <{pr.url}|#{pr.id}> Alert*\n"
-                            f"*Creator:* {mention}\n"
-                            f"*Age:* {pr.age} days\n"
-                            f"*Status:* {reason}"
-                        ),
-                    },
-                }
-            ],
+        block = {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": (
+                    f"*🚨 Stale PR <{pr.url}|#{pr.id}> Alert*\n"
+                    f"*Creator:* {mention}\n"
+                    f"*Age:* {pr.age} days\n"
+                    f"*Status:* {reason}"
+                ),
+            },
         }
+        with self.slack_lock:
+            self.pending_slack_blocks.append((pr.id, block))
 
-        response = requests.post(self.slack_webhook_url, json=slack_payload)
-        response.raise_for_status()
-        self.logger.info(f"Slack notification sent for PR #{pr.id}")
+    def send_slack_notifications(self) -> None:
+        """Send all queued PR blocks to Slack, as few messages as possible."""
+        if not self.pending_slack_blocks:
+            return
+
+        # Workers finish in any order; list PRs by number
+        blocks = [block for _, block in sorted(self.pending_slack_blocks)]
+        for start in range(0, len(blocks), SLACK_MAX_BLOCKS):
+            batch = blocks[start : start + SLACK_MAX_BLOCKS]
+            slack_payload = {"text": f"🚨 {len(batch)} stale PRs", "blocks": batch}
+            response = self.slack_session.post(
+                self.slack_webhook_url,
+                data=json_dumps(slack_payload),
+                headers={"Content-Type": "application/json"},
+            )
+            response.raise_for_status()
+        self.logger.info(f"Slack notification sent for {len(blocks)} PRs")
+        self.pending_slack_blocks = []
+
+    def _process_one(
+        self, pr_data: Dict, created_at: datetime, now: datetime
+    ) -> Optional[PullRequest]:
+        """
+        Notify a single PR past the stale threshold if it is not yet labeled;
+        return it if so.
+        """
+        # Labels come with the list response, so already-flagged PRs are
+        # skipped without another request
+        labels = [label["name"] for label in pr_data["labels"]["nodes"]]
+        if self.stale_label in labels:
+            return None
+
+        pr_id = pr_data["number"]
+        age = (now - created_at).days
+        pr = PullRequest(
+            id=pr_id,
+            node_id=pr_data["id"],
+            # Deleted accounts have no author
+            creator=(pr_data["author"] or {}).get("login", "ghost"),
+            url=pr_data["url"],
+            created_at=created_at,
+            age=age,
+            labels=labels,
+        )
+
+        self.notify_pr(pr)
+        self.queue_slack_notification(pr)
+        return pr
 
     def process_pull_requests(self) -> None:
-        """Process PRs that are older than the stale threshold and do not have the 'stale' label."""
+        """Process PRs that are older than the stale threshold and do not have the stale label."""
         try:
             self.logger.info(f"Starting stale PR check for {self.repo}")
             self.logger.info(f"Stale threshold: {self.stale_days} days")
 
-            pull_requests = self.get_pull_requests()
             now = datetime.now(timezone.utc)
-
-            for pr_data in pull_requests:
-                pr_id = pr_data["number"]
-                created_at = datetime.fromisoformat(
-                    pr_data["created_at"].replace("Z", "+00:00")
-                )
-                age = (now - created_at).days
-                labels = [label["name"] for label in pr_data.get("labels", [])]
-
-                if "stale" in labels or age < self.stale_days:
-                    continue
-
-                pr = PullRequest(
-                    id=pr_id,
-                    creator=pr_data["user"]["login"],
-                    url=pr_data["html_url"],
-                    created_at=created_at,
-                    age=age,
-                    labels=labels,
-                )
-
-                self.notify_pr(pr)
-                self.send_slack_notification(pr)
+            # PRs created after this are younger than the stale threshold
+            cutoff = now - timedelta(days=self.stale_days)
+
+            # Per-PR work is network-bound, so process PRs concurrently over the
+            # shared session; one failing PR doesn't stop the others
+            failures = 0
+            notified = 0
+            listing_failed = False
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {}
+                try:
+                    for pr_data in self.get_pull_requests():
+                        # PRs come oldest first, so once one is too young to be
+                        # stale, so are all the rest
+                        created_at = parse_timestamp(pr_data["createdAt"])
+                        if created_at > cutoff:
+                            break
+                        future = executor.submit(
+                            self._process_one, pr_data, created_at, now
+                        )
+                        futures[future] = pr_data["number"]
+                except Exception as e:
+                    # Pages are fetched while earlier PRs are being notified;
+                    # let those finish and still get their Slack alert below
+                    listing_failed = True
+                    self.logger.error(f"Error fetching PRs: {str(e)}")
+                for future in as_completed(futures):
+                    try:
+                        if future.result() is not None:
+                            notified += 1
+                    except Exception as e:
+                        # Any per-PR error is isolated, so PRs that were already
+                        # labeled still get their Slack alert below
+                        failures += 1
+                        self.logger.error(
+                            f"Error processing PR #{futures[future]}: {str(e)}"
+                        )
+
+            save_etag_cache(self.etag_cache_used)
+            self.logger.info(f"Notified {notified} stale PRs")
+            self.send_slack_notifications()
+            if failures:
+                self.logger.error(f"Failed to process {failures} PRs")
+            if failures or listing_failed:
+                sys.exit(1)
 
         except requests.RequestException as e:
             self.logger.error(f"Error fetching PRs: {str(e)}")